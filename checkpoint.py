@@ -0,0 +1,199 @@
+import hashlib
+import io
+import json
+import os
+from collections import defaultdict
+from csv import DictReader
+from dataclasses import dataclass, fields
+from typing import Dict, List, Optional
+
+from coins import Coin, CoinType, Grade
+from countries import map_to_region_name
+from duplicates import DuplicateIndex
+from main import has_needed_fields, read_coins
+
+
+@dataclass
+class Checkpoint:
+    """A class to remember how much of a csv export has already been parsed.
+
+    Checkpoints are saved as plain JSON, so loading one never runs any code.
+
+    Attributes
+    ----------
+    offset : int
+        The number of bytes at the start of the file that have been parsed.
+        Always falls at the end of a line.
+    prefix_hash : str
+        The sha256 of the first `offset` bytes of the file, used to tell
+        whether rows were only appended or the file was rewritten.
+    header : List[str]
+        The fields named on the first line of the file.
+    exclusions : Dict[str, list]
+        The filter the coins were parsed with.
+    coins : Dict[str, List[Coin]]
+        The coins parsed from the first `offset` bytes, keyed by region.
+    duplicates : Optional[DuplicateIndex] = None
+        The duplicates found in those bytes, if they were being looked for.
+        The copies it keeps are saved by their region and index in `coins`.
+    """
+
+    offset: int
+    prefix_hash: str
+    header: List[str]
+    exclusions: Dict[str, list]
+    coins: Dict[str, List[Coin]]
+    duplicates: Optional[DuplicateIndex] = None
+
+
+def _coin_to_json(c: Coin) -> list:
+    """Return the fields of a Coin as a list of JSON values."""
+
+    return [getattr(c, f.name).value if f.name in ("type", "grade") else getattr(c, f.name) for f in fields(Coin)]
+
+
+def _coin_from_json(values: list) -> Coin:
+    """Create a Coin from a list made by `_coin_to_json()`."""
+
+    return Coin(*values[:12], type=CoinType(values[12]), mintmark=values[13], grade=Grade(values[14]), comment=values[15])
+
+
+def load_checkpoint(checkpoint_file: str) -> Optional[Checkpoint]:
+    """Load a checkpoint from disk, if there is a usable one."""
+
+    try:
+        with open(checkpoint_file, "r") as f:
+            data = json.load(f)
+        coins = {region: [_coin_from_json(c) for c in ls] for region, ls in data['coins'].items()}
+        duplicates = None
+        if data['duplicates'] is not None:
+            duplicates = DuplicateIndex()
+            for key, region, index in data['duplicates']['kept']:
+                duplicates.kept[tuple(key)] = (coins[region], index)
+            for key, trades in data['duplicates']['trades']:
+                duplicates.trades[tuple(key)] = [_coin_from_json(c) for c in trades]
+        return Checkpoint(
+            offset=data['offset'],
+            prefix_hash=data['prefix_hash'],
+            header=data['header'],
+            exclusions=data['exclusions'],
+            coins=coins,
+            duplicates=duplicates
+        )
+    except (OSError, ValueError, KeyError, IndexError, TypeError):
+        return None
+
+
+def save_checkpoint(checkpoint: Checkpoint, checkpoint_file: str) -> None:
+    """Write a checkpoint to disk, replacing the previous one atomically."""
+
+    duplicates = None
+    if checkpoint.duplicates is not None:
+        regions = {id(ls): region for region, ls in checkpoint.coins.items()}
+        duplicates = {
+            'kept': [[key, regions[id(ls)], index] for key, (ls, index) in checkpoint.duplicates.kept.items()],
+            'trades': [[key, [_coin_to_json(c) for c in trades]] for key, trades in checkpoint.duplicates.trades.items()],
+        }
+    temp_file = f"{checkpoint_file}.tmp"
+    with open(temp_file, "w") as f:
+        json.dump({
+            'offset': checkpoint.offset,
+            'prefix_hash': checkpoint.prefix_hash,
+            'header': checkpoint.header,
+            'exclusions': checkpoint.exclusions,
+            'coins': {region: [_coin_to_json(c) for c in ls] for region, ls in checkpoint.coins.items()},
+            'duplicates': duplicates,
+        }, f)
+    os.replace(temp_file, checkpoint_file)
+
+
+def _add_coins(reader: DictReader, exclusions: Dict[str, list], my_coins: Dict[str, List[Coin]], duplicates: Optional[DuplicateIndex]) -> None:
+    """Parse the rows of the reader into a dictionary of collections."""
+
+    for coin in read_coins(reader, exclusions):
+        if duplicates is None:
+            my_coins[map_to_region_name(coin.country)].append(coin)
+        else:
+            duplicates.add(coin, my_coins[map_to_region_name(coin.country)])
+
+
+def _reader(data: bytes, fieldnames: List[str]=None) -> DictReader:
+    """Return a reader over some bytes of a csv, decoded the same way as `open()`."""
+
+    return DictReader(io.TextIOWrapper(io.BytesIO(data)), fieldnames=fieldnames)
+
+
+def checkpointed_parser(filename: str, exclusions: Dict[str, list]=None, checkpoint_file: str=None, duplicates: DuplicateIndex=None) -> Optional[Dict[str, List[Coin]]]:
+    """Parse a csv like `parser()`, only reading rows added since the last run.
+
+    A checkpoint is kept next to the csv (or at `checkpoint_file`) recording
+    how far into the file has been parsed. When the file still starts with
+    the exact bytes that were parsed before, only the rows appended after
+    them are parsed and added to the stored collections. Otherwise, or if
+    the exclusions changed, the whole file is parsed again.
+
+    `duplicates` works the same as in `parser()`, and should start out empty.
+    The duplicates found by earlier runs are loaded into it from the 
+    checkpoint, so appended rows are still compared against every row.
+    """
+
+    checkpoint_file = checkpoint_file or f"{filename}.checkpoint"
+    exclusions = exclusions or {}
+    with open(filename, "rb") as f:
+        data = f.read()
+    # Only whole lines are checkpointed, in case the export is still being written
+    offset = data.rfind(b"\n") + 1
+    if offset == 0:
+        reader = _reader(data)
+        if not has_needed_fields(reader.fieldnames):
+            return None
+        my_coins = defaultdict(list)
+        _add_coins(reader, exclusions, my_coins, duplicates)
+        return my_coins
+
+    checkpoint = load_checkpoint(checkpoint_file)
+    prefix_hash = None
+    if (checkpoint is not None
+            and checkpoint.exclusions == exclusions
+            and (checkpoint.duplicates is None) == (duplicates is None)
+            and checkpoint.offset <= offset):
+        prefix_hash = hashlib.sha256(data[:checkpoint.offset])
+        if prefix_hash.hexdigest() != checkpoint.prefix_hash:
+            prefix_hash = None
+
+    reparsed = prefix_hash is None
+    if not reparsed:
+        # Only rows were appended, so carry on from where the last run stopped
+        header = checkpoint.header
+        my_coins = defaultdict(list, checkpoint.coins)
+        if duplicates is not None:
+            duplicates.kept.update(checkpoint.duplicates.kept)
+            duplicates.trades.update(checkpoint.duplicates.trades)
+        if checkpoint.offset < offset:
+            _add_coins(_reader(data[checkpoint.offset:offset], header), exclusions, my_coins, duplicates)
+            prefix_hash.update(data[checkpoint.offset:offset])
+    else:
+        reader = _reader(data[:offset])
+        # csv is not formatted right
+        if not has_needed_fields(reader.fieldnames):
+            return None
+        header = reader.fieldnames
+        my_coins = defaultdict(list)
+        _add_coins(reader, exclusions, my_coins, duplicates)
+        prefix_hash = hashlib.sha256(data[:offset])
+
+    if reparsed or checkpoint.offset != offset:
+        save_checkpoint(Checkpoint(
+            offset=offset,
+            prefix_hash=prefix_hash.hexdigest(),
+            header=header,
+            exclusions=exclusions,
+            coins=dict(my_coins),
+            duplicates=duplicates
+        ), checkpoint_file)
+
+    # A last row with no line ending is returned but left out of the checkpoint,
+    # which is already on disk, so it is fine to add to the same lists
+    if offset < len(data):
+        _add_coins(_reader(data[offset:], header), exclusions, my_coins, duplicates)
+    return my_coins
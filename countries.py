@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import Dict
+from typing import Dict, List
 
 
 class Region(Enum):
@@ -272,4 +272,19 @@ def map_to_region_name(country: str) -> str:
     
     if country in COUNTRIES:
         return COUNTRIES[country].value
-    return ""
\ No newline at end of file
+    return ""
+
+
+def build_routes(groups: Dict[str, List[str]]) -> Dict[str, str]:
+    """Return a table of which book each country's coins go into.
+    
+    `groups` maps the name of each book to the regions it holds. Countries 
+    whose region is in none of the books are left out of the table.
+    """
+
+    region_books = {region: book for book, group in groups.items() for region in group}
+    return {
+        country: region_books[region.value] 
+        for country, region in COUNTRIES.items() 
+        if region.value in region_books
+    }
\ No newline at end of file
@@ -0,0 +1,87 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from coins import Coin, Grade
+
+
+# How good each grade is, from worst to best
+GRADE_RANK: Dict[Grade, int] = {
+    Grade.NO_GRADE: 0,
+    Grade.GOOD: 1,
+    Grade.VERY_GOOD: 2,
+    Grade.FINE: 3,
+    Grade.VERY_FINE: 4,
+    Grade.EXTREMELY_FINE: 5,
+    Grade.ALMOST_UNCIRCULATED: 6,
+    Grade.UNCIRCULATED: 7,
+}
+
+# The numista_id, year and mintmark that make two coins the same
+DuplicateKey = Tuple[int, int, str]
+
+
+def duplicate_key(c: Coin) -> DuplicateKey:
+    """Return the key two coins share when one is a duplicate of the other."""
+
+    return (c.numista_id, c.year, c.mintmark)
+
+
+@dataclass
+class DuplicateIndex:
+    """A class to keep only the best graded copy of each coin while parsing.
+
+    Coins are added one at a time as they are parsed, so duplicates are found
+    without another pass over the collection. The first copy of a coin is
+    appended to its list as normal and its position remembered; a later copy
+    with a better grade takes its place in that list. Every other copy goes
+    to the trade list.
+
+    Attributes
+    ----------
+    kept : Dict[DuplicateKey, Tuple[List[Coin], int]] = field(default_factory=dict)
+        The list holding the copy being kept of each coin, and its index.
+    trades : Dict[DuplicateKey, List[Coin]] = field(default_factory=dict)
+        The copies not being kept, for each coin that has duplicates.
+    """
+
+    kept: Dict[DuplicateKey, Tuple[List[Coin], int]] = field(default_factory=dict)
+    trades: Dict[DuplicateKey, List[Coin]] = field(default_factory=dict)
+
+
+    def add(self, c: Coin, coins: List[Coin]) -> None:
+        """Append a coin to a list, unless it is a duplicate.
+
+        The lists coins are added to must not be reordered until parsing is
+        done, as the kept copies are replaced by their index.
+        """
+
+        key = duplicate_key(c)
+        if key not in self.kept:
+            self.kept[key] = (coins, len(coins))
+            coins.append(c)
+            return
+
+        kept_coins, index = self.kept[key]
+        if GRADE_RANK[c.grade] > GRADE_RANK[kept_coins[index].grade]:
+            self.trades.setdefault(key, []).append(kept_coins[index])
+            kept_coins[index] = c
+        else:
+            self.trades.setdefault(key, []).append(c)
+
+
+    def get_trades(self) -> List[Coin]:
+        """Return every coin that is a trade candidate."""
+
+        trades = []
+        for coins in self.trades.values():
+            trades.extend(coins)
+        return trades
+
+
+    def get_group(self, key: DuplicateKey) -> List[Coin]:
+        """Return every copy of a coin, starting with the one being kept."""
+
+        if key not in self.kept:
+            return []
+        kept_coins, index = self.kept[key]
+        return [kept_coins[index]] + self.trades.get(key, [])
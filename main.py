@@ -1,85 +1,160 @@
 from collections import defaultdict
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
 
 from csv import DictReader
 
 from coins import Coin, CoinType, Grade
-from pages import Page, create_book
-from countries import map_to_region_name
+from duplicates import DuplicateIndex
+from pages import Page, create_book_from_segments, diameter_class
+from countries import build_routes, map_to_region_name
 
 
-def parser(filename: str, exclusions: Dict[str, list]=None) -> Optional[Dict[str, List[Coin]]]:
+# Coins whose fields (keys) match any of the values are left out of the books
+EXCLUSIONS: Dict[str, List[str]] = {
+    "Grade": ["UNC"], 
+    "Composition": ["Gold (.900)"],
+    "Collection": [
+        "Uncirculated / Sealed", 
+        "Specialized Folder (for circulating coins)", 
+        "Quarter Commemorative Book", 
+        "Toonie Commemorative Book",
+        "Euro Booklet"
+    ]
+}
+
+# Group coins based on how I want my books
+BOOK_GROUPS: Dict[str, List[str]] = {
+    "Asia / Africa": ["Asia", "Africa"],
+    "North America / Oceania": ["North America", "Oceania"],
+    "Latin America / Eastern Europe": ["Central America", "Caribbean", "South America", "Eastern Europe"],
+    "Western Europe": ["Western Europe"]
+}
+
+
+NEEDED_FIELDS = ["Country", "Issuer", "Face value", "Reference", "N# number (with link)", "Title", "Type", "Composition", "Weight", "Diameter", "Thickness", "Year", "Gregorian year", "Mintmark", "Grade", "Collection", "Public comment"]
+
+
+def has_needed_fields(fieldnames: List[str]) -> bool:
+    """Return whether a csv header contains every field needed to make a Coin."""
+
+    return [x for x in fieldnames or [] if x in NEEDED_FIELDS] == NEEDED_FIELDS
+
+
+def row_to_coin(row: Dict[str, str]) -> Coin:
+    """Create a Coin from a row of a Numista csv."""
+
+    return Coin(
+        country=row['Country'],
+        issuer=row['Issuer'],
+        face_value=float(row['Face value']),
+        numista_id=int(row['N# number (with link)'].split("N# ", 1)[1]),
+        title=row['Title'],
+        composition=row['Composition'],
+        weight=float(row['Weight']),
+        diameter=float(row['Diameter']),
+        thickness=float(row['Thickness']) if row['Thickness'] else None,
+        year=int(row['Year']) if row['Year'] else -1,
+        reference=row['Reference'],
+        type=CoinType(row['Type']),
+        gregorian_year=int(row['Gregorian year']),
+        mintmark=row['Mintmark'],
+        grade=Grade(row['Grade']),
+        comment=row['Public comment']
+    )
+
+
+def read_coins(reader: DictReader, exclusions: Dict[str, list]=None) -> Iterator[Coin]:
+    """Yield a Coin for every row of the reader not filtered out by exclusions."""
+
+    for row in reader:
+        include = True
+        for ex_field in (exclusions or {}).keys():
+            for ex_value in exclusions[ex_field]:
+                if row[ex_field] == ex_value:
+                    include = False
+                    break
+            if not include:
+                break
+        else:
+            yield row_to_coin(row)
+
+
+def parser(filename: str, exclusions: Dict[str, list]=None, duplicates: DuplicateIndex=None) -> Optional[Dict[str, List[Coin]]]:
     """Parse a csv and return a dictionary of all current collections.
     
     Exclusions acts as a filter, where coins whose fields (keys) are of a
-    given value (value) are not included in the returned dictionary.
+    given value (value) are not included in the returned dictionary. If 
+    `duplicates` is given, only the best graded copy of each coin is kept and
+    the rest are left in its trade list.
     """
 
-    needed_fields = ["Country", "Issuer", "Face value", "Reference", "N# number (with link)", "Title", "Type", "Composition", "Weight", "Diameter", "Thickness", "Year", "Gregorian year", "Mintmark", "Grade", "Collection", "Public comment"]
     with open(filename, "r") as f:
         reader = DictReader(f)
         # csv is not formatted right
-        if [x for x in reader.fieldnames if x in needed_fields] != needed_fields:
+        if not has_needed_fields(reader.fieldnames):
             return None
         # parse each line
         my_coins = defaultdict(list)
-        for row in reader:
-            include = True
-            for ex_field in exclusions.keys():
-                for ex_value in exclusions[ex_field]:
-                    if row[ex_field] == ex_value:
-                        include = False
-                        break
-                if not include:
-                    break
+        for coin in read_coins(reader, exclusions):
+            if duplicates is None:
+                my_coins[map_to_region_name(coin.country)].append(coin)
             else:
-                my_coins[map_to_region_name(row['Country'])].append(Coin(
-                    country=row['Country'],
-                    issuer=row['Issuer'],
-                    face_value=float(row['Face value']),
-                    numista_id=int(row['N# number (with link)'].split("N# ", 1)[1]),
-                    title=row['Title'],
-                    composition=row['Composition'],
-                    weight=float(row['Weight']),
-                    diameter=float(row['Diameter']),
-                    thickness=float(row['Thickness']) if row['Thickness'] else None,
-                    year=int(row['Year']) if row['Year'] else -1,
-                    reference=row['Reference'],
-                    type=CoinType(row['Type']),
-                    gregorian_year=int(row['Gregorian year']),
-                    mintmark=row['Mintmark'],
-                    grade=Grade(row['Grade']),
-                    comment=row['Public comment']
-                ))
+                duplicates.add(coin, my_coins[map_to_region_name(coin.country)])
         return my_coins
 
 
-def main():
-    dont_includes = {
-        "Grade": ["UNC"], 
-        "Composition": ["Gold (.900)"],
-        "Collection": [
-            "Uncirculated / Sealed", 
-            "Specialized Folder (for circulating coins)", 
-            "Quarter Commemorative Book", 
-            "Toonie Commemorative Book",
-            "Euro Booklet"
-        ]
-    }
-    my_coins = parser("Collections/YaBoiLennyG_coins.csv", dont_includes)
-
-    # Group coins based on how I want my books
-    groups: Dict[str, List[str]] = {
-        "Asia / Africa": ["Asia", "Africa"],
-        "North America / Oceania": ["North America", "Oceania"],
-        "Latin America / Eastern Europe": ["Central America", "Caribbean", "South America", "Eastern Europe"],
-        "Western Europe": ["Western Europe"]
-    }
+def book_parser(filename: str, routes: Dict[str, str], exclusions: Dict[str, list]=None, duplicates: DuplicateIndex=None) -> Optional[Dict[str, Dict[int, List[Coin]]]]:
+    """Parse a csv straight into the books its coins belong in.
+    
+    `routes` is a table from `build_routes()`. Each coin is put in its book's
+    list for its `diameter_class()`, ready for `create_book_from_segments()`.
+    Coins from countries not in `routes` are left out. `duplicates` works the
+    same as in `parser()`.
+    """
+
+    with open(filename, "r") as f:
+        reader = DictReader(f)
+        # csv is not formatted right
+        if not has_needed_fields(reader.fieldnames):
+            return None
+        # parse each line
+        my_books = defaultdict(lambda: defaultdict(list))
+        for coin in read_coins(reader, exclusions):
+            book = routes.get(coin.country)
+            if book is None:
+                continue
+            if duplicates is None:
+                my_books[book][diameter_class(coin.diameter)].append(coin)
+            else:
+                duplicates.add(coin, my_books[book][diameter_class(coin.diameter)])
+        return my_books
+
 
-    # Put all the region coins in a list per book (my_collections)
-    my_collections: Dict[str, List[Coin]] = defaultdict(list)
-    for group_name, group in groups.items():
-        [my_collections[group_name].extend(my_coins[g]) for g in group]
+def build_books(filename: str, groups: Dict[str, List[str]]=BOOK_GROUPS, exclusions: Dict[str, list]=EXCLUSIONS, duplicates: DuplicateIndex=None) -> Optional[Dict[str, List[Page]]]:
+    """Parse a csv and create every book in `groups`, as `main()` does.
+
+    Only the best graded copy of each coin is put in the books. Pass in a
+    DuplicateIndex to get the trade list back.
+    """
+
+    duplicates = duplicates or DuplicateIndex()
+    my_books = book_parser(filename, build_routes(groups), exclusions, duplicates)
+    if my_books is None:
+        return None
+    return {book: create_book_from_segments(my_books[book]) for book in groups}
+
+
+def print_book(name: str, book: List[Page]) -> None:
+    """Print how many pages a book uses and how full each one is."""
+
+    print(name)
+    print(f"Total pages: {len(book)}\n{[len(p) for p in book]}\n")
+
+
+def main():
+    duplicates = DuplicateIndex()
+    books = build_books("Collections/YaBoiLennyG_coins.csv", duplicates=duplicates)
+    trades = duplicates.get_trades()
 
     group_nums = {
         0: "Asia / Africa",
@@ -88,12 +163,8 @@ def main():
         3: "Western Europe"
     }
 
-    # The actual algorithm to put the coins into pages
-    books: Dict[str, List[Page]] = defaultdict(list)
-    for book, coins in my_collections.items():
-        print(book)
-        books[book] = create_book(coins)
-        print(f"Total pages: {len(books[book])}\n{[len(p) for p in books[book]]}\n")
+    for book, pages in books.items():
+        print_book(book, pages)
 
     option = ""
     while option != "q":
@@ -102,6 +173,7 @@ def main():
             print(f"({i}) {book}")
         print()
         print(f"(p) Total Pages")
+        print(f"(t) Trade List")
         print(f"(q) Quit\n")
         option = input().strip().lower()
         if option.isnumeric() and int(option) < len(books):
@@ -131,6 +203,11 @@ def main():
             print("\nTotals for each page:")
             [print(f"{n}:\t{total:2}") for n, total in my_pages.items()]
             print()
+        elif option == "t":
+            print(f"\nTrade list ({len(trades)} coins):")
+            for coin in trades:
+                print(f"({coin.year:4}, {coin.issuer})\t{coin.title} [{coin.grade.value or '-'}]")
+            print()
         else:
             print(f"\nInvalid input '{option}'\n")
 
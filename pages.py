@@ -1,14 +1,20 @@
+import hashlib
 from collections import defaultdict
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional
+from itertools import product
+from typing import Dict, List, Optional, Tuple
 
 from coins import Coin
+from duplicates import DuplicateIndex
 
 
 NUMIS_PAGES = [
     "NUMIS 17", "NUMIS 25", "NUMIS 34", "NUMIS 44", "NUMIS MIX"
 ]
 
+# The largest diameter each size of page can hold, smallest first
+DIAMETER_CLASSES = [17, 25, 34, 44]
+
 
 class SlotFullException(Exception):
     """Raised when trying to add a Coin to a full Slot."""
@@ -210,6 +216,22 @@ class Page:
         return coins
 
 
+    def fingerprint(self) -> str:
+        """Return a hash of the Page's layout and the coins in each pocket.
+        
+        Coins are identified by their numista_id, year and mintmark, so two 
+        Pages with the same fingerprint look the same once printed. The hash 
+        is worked out each time, as Pages change when coins are pushed.
+        """
+
+        h = hashlib.sha256(self.name.encode())
+        for slot in self.slots:
+            h.update(f"|{slot.capacity}:{slot.max_diameter}".encode())
+            for c in slot.coins:
+                h.update(b";" if c is None else f";{c.numista_id},{c.year},{c.mintmark}".encode())
+        return h.hexdigest()
+
+
 def get_page(name: str) -> Optional[Page]:
     """Retrieve a potential page based on its name."""
     if name == "NUMIS 44":
@@ -225,34 +247,179 @@ def get_page(name: str) -> Optional[Page]:
     return None
 
 
-def create_book(coins: List[Coin]) -> List[Page]:
+# The number of coins a page of each size holds
+PAGE_CAPACITIES: Dict[int, int] = {size: get_page(f"NUMIS {size}").get_capacity() for size in DIAMETER_CLASSES}
+
+# The number of coins of each size a MIX page holds
+MIX_QUOTAS: Dict[int, int] = {int(slot.max_diameter): slot.capacity for slot in get_page("NUMIS MIX").slots}
+
+# The number of pockets on each page that a coin of each size fits in
+PAGE_POCKETS: Dict[str, Dict[int, int]] = {
+    name: {size: sum(slot.capacity for slot in get_page(f"NUMIS {name}").slots if slot.max_diameter >= size) for size in [34, 25, 17]}
+    for name in ["34", "25", "17", "MIX"]
+}
+
+
+def book_fingerprint(book: List[Page]) -> str:
+    """Return the root of a Merkle tree over the fingerprints of a book's Pages.
+    
+    The fingerprint changes if any Page changes, or if Pages are added, 
+    removed or moved.
+    """
+
+    level = [p.fingerprint() for p in book]
+    if not level:
+        return hashlib.sha256(b"").hexdigest()
+    while len(level) > 1:
+        # Pairs are hashed together, and an odd Page out is carried up as is
+        pairs = [
+            hashlib.sha256(f"node:{level[i]}{level[i + 1]}".encode()).hexdigest()
+            for i in range(0, len(level) - 1, 2)
+        ]
+        level = pairs + level[len(pairs) * 2:]
+    return level[0]
+
+
+def changed_pages(book: List[Page], fingerprints: List[str]) -> List[int]:
+    """Return the index of every Page whose fingerprint is not the one given.
+    
+    `fingerprints` are those of the book as it was last exported, so only the 
+    returned Pages need to be made again.
+    """
+
+    return [
+        i for i, page in enumerate(book)
+        if i >= len(fingerprints) or page.fingerprint() != fingerprints[i]
+    ]
+
+
+def diameter_class(diameter: float) -> int:
+    """Return the size of page a coin of a given diameter belongs on.
+    
+    Coins too large for any page are given a class of 0.
+    """
+
+    for size in DIAMETER_CLASSES:
+        if diameter <= size:
+            return size
+    return 0
+
+
+def plan_leftover_pages(coin_counts: Dict[int, int]) -> List[str]:
+    """Return the suffix of the page names needed for the leftover coins.
+    
+    `coin_counts` is the number of 17mm, 25mm and 34mm coins that did not 
+    make up a full page of their own size. Smaller coins also fit in larger 
+    pockets, so some pages hold the coins as long as, for every size, there 
+    are enough pockets of that size or larger for the coins of that size or 
+    larger. Every number of pages of each size (up to the number needed 
+    without MIX pages) is tried along with the fewest MIX pages that make 
+    up the rest, and the plan using the fewest pages is returned.
+    """
+
+    sizes = [34, 25, 17]
+    # The coins that need a pocket of each size or larger
+    needed = {size: sum(coin_counts[s] for s in sizes if s >= size) for size in sizes}
+
+    # Find how many pages each number of single pages (34, 25, 17) needs
+    most_singles = sum(-(-coin_counts[size] // PAGE_CAPACITIES[size]) for size in sizes)
+    num_mix: Dict[Tuple[int, ...], int] = {}
+    for singles in product(range(most_singles + 1), repeat=len(sizes)):
+        num_mix[singles] = 0
+        for size in sizes:
+            remaining = needed[size] - sum(n * PAGE_POCKETS[str(s)][size] for s, n in zip(sizes, singles))
+            num_mix[singles] = max(num_mix[singles], -(-remaining // PAGE_POCKETS["MIX"][size]))
+    min_count = min(sum(singles) + num_mix[singles] for singles in num_mix)
+
+    # On a tie, prefer all MIX, then one page of each size with coins, then 
+    # one single page plus MIX. After that, prefer pages of sizes with coins,
+    # at most one page of each size, and then the larger pages.
+    one_of_each = tuple(int(coin_counts[size] > 0) for size in sizes)
+    def preference(singles: Tuple[int, ...]) -> tuple:
+        return (
+            sum(singles) > 0,
+            singles != one_of_each,
+            sum(singles) != 1,
+            sum(n for s, n in zip(sizes, singles) if coin_counts[s] == 0),
+            max(singles) > 1,
+            [-n for n in singles]
+        )
+
+    best = min((singles for singles in num_mix if sum(singles) + num_mix[singles] == min_count), key=preference)
+    return [str(s) for s, n in zip(sizes, best) for _ in range(n)] + ["MIX"] * num_mix[best]
+
+
+def count_pages(counts: Dict[int, int]) -> Dict[str, int]:
+    """Return how many of each page a book would use, without creating it.
+    
+    `counts` is the number of coins in each `diameter_class()`. The result 
+    matches the pages `create_book_from_segments()` would return.
+    """
+
+    pages: Dict[str, int] = defaultdict(int)
+    if counts.get(44, 0) > 0:
+        pages["NUMIS 44"] = -(-counts[44] // PAGE_CAPACITIES[44])
+    leftover = {}
+    for size in [34, 25, 17]:
+        full_pages, leftover[size] = divmod(counts.get(size, 0), PAGE_CAPACITIES[size])
+        if full_pages:
+            pages[f"NUMIS {size}"] = full_pages
+    for size in plan_leftover_pages(leftover):
+        pages[f"NUMIS {size}"] += 1
+    return dict(pages)
+
+
+def create_book(coins: List[Coin], duplicates: DuplicateIndex=None) -> List[Page]:
     """Create a book using a list of coins provided.
     
     The book will be created in such a way as to use the fewest number of 
-    pages possible out of the available pages.
+    pages possible out of the available pages. If `duplicates` is given, 
+    only the best graded copy of each coin is put in the book.
     """
 
-    # Sort by diameter (ascending)
-    coins.sort(key=lambda c : (c.diameter, c.issuer, c.gregorian_year, c.title))
-
     # Break the list into segments 
     segments: Dict[int, List[Coin]] = defaultdict(list)
     for c in coins:
-        if c.diameter <= 17:
-            segments[17].append(c)
-        elif c.diameter <= 25:
-            segments[25].append(c)
-        elif c.diameter <= 34:
-            segments[34].append(c)
-        elif c.diameter <= 44:
-            segments[44].append(c)
+        if duplicates is None:
+            segments[diameter_class(c.diameter)].append(c)
         else:
-            segments[0].append(c)
-    [ls.sort(key=lambda c : (c.issuer, c.gregorian_year, c.title)) for ls in segments.values()]
+            duplicates.add(c, segments[diameter_class(c.diameter)])
+    return create_book_from_segments(segments)
+
+
+def estimate_book(coins: List[Coin], duplicates: DuplicateIndex=None) -> Dict[str, int]:
+    """Return how many of each page `create_book()` would use for some coins.
+    
+    Only the number of coins in each `diameter_class()` is needed, so no 
+    Pages are created and the coins are not sorted. `duplicates` works the
+    same as in `create_book()`.
+    """
+
+    if duplicates is not None:
+        kept: List[Coin] = []
+        for c in coins:
+            duplicates.add(c, kept)
+        coins = kept
+    counts: Dict[int, int] = defaultdict(int)
+    for c in coins:
+        counts[diameter_class(c.diameter)] += 1
+    return count_pages(counts)
+
+
+def create_book_from_segments(segments: Dict[int, List[Coin]]) -> List[Page]:
+    """Create a book from coins already split up by `diameter_class()`.
+    
+    The lists in `segments` are sorted and emptied as the coins are put 
+    into pages.
+    """
+
+    segments = defaultdict(list, segments)
+    # Sort by issuer, using the diameter (ascending) to break ties
+    [ls.sort(key=lambda c : (c.issuer, c.gregorian_year, c.title, c.diameter)) for ls in segments.values()]
 
     # Start from the largest coins and work our way down
     book: List[Page] = []
-    for size in reversed(segments):
+    for size in [s for s in [0] + DIAMETER_CLASSES[::-1] if s in segments]:
         new_page = get_page(f"NUMIS {size}")
         # Error handling (sent a faulty page)
         if new_page is None:
@@ -262,6 +429,8 @@ def create_book(coins: List[Coin]) -> List[Page]:
             while segments[44]:
                 while segments[44] and not new_page.is_full():
                     new_page.push_coin(segments[44].pop(0))
+                book.append(new_page)
+                new_page = get_page(f"NUMIS {size}")
         else:
             # Put as many large coins in as we can
             while len(segments[size]) >= new_page.get_capacity():
@@ -270,88 +439,29 @@ def create_book(coins: List[Coin]) -> List[Page]:
                     new_page.push_coin(segments[size].pop(0))
                 book.append(new_page)
                 new_page = get_page(f"NUMIS {size}")
-    def num_mix_pages() -> List[str]:
-        """Return the suffix of the remaining page names."""
-
-        # TODO: Probably figure out how to make this method smaller lmao
-        coin_counts = {
-            17: len(segments[17]),
-            25: len(segments[25]),
-            34: len(segments[34])
-        }
-        min_pages_needed = ["34", "25", "17"]
-        pages_needed = []
-        # Test against all MIX
-        temp_nums = dict(coin_counts)
-        while [x for x in temp_nums.values() if x > 0]:
-            pages_needed.append("MIX")
-            temp_nums[17] -= 16
-            temp_nums[25] -= 12
-            temp_nums[34] -= 5
-        min_pages_needed = pages_needed if len(pages_needed) <= len(min_pages_needed) else min_pages_needed
-        # Test against one 34 page + MIXes
-        temp_nums = dict(coin_counts)
-        temp_nums[34] -= 20
-        pages_needed = []
-        pages_needed.append("34")
-        while [x for x in temp_nums.values() if x > 0]:
-            pages_needed.append("MIX")
-            temp_nums[17] -= 16
-            temp_nums[25] -= 12
-            temp_nums[34] -= 5
-        min_pages_needed = pages_needed if len(pages_needed) < len(min_pages_needed) else min_pages_needed
-        # Test against one 25 page + MIXes
-        temp_nums = dict(coin_counts)
-        temp_nums[25] -= 30
-        pages_needed = []
-        pages_needed.append("25")
-        while [x for x in temp_nums.values() if x > 0]:
-            pages_needed.append("MIX")
-            temp_nums[17] -= 16
-            temp_nums[25] -= 12
-            temp_nums[34] -= 5
-        min_pages_needed = pages_needed if len(pages_needed) < len(min_pages_needed) else min_pages_needed
-        # Test against one 17 page + MIXes
-        temp_nums = dict(coin_counts)
-        temp_nums[17] -= 48
-        pages_needed = []
-        pages_needed.append("17")
-        while [x for x in temp_nums.values() if x > 0]:
-            pages_needed.append("MIX")
-            temp_nums[17] -= 16
-            temp_nums[25] -= 12
-            temp_nums[34] -= 5
-        min_pages_needed = pages_needed if len(pages_needed) < len(min_pages_needed) else min_pages_needed
-        return min_pages_needed
 
     # Figure out whether using MIX pages results in fewer pages
-    excess_pages = num_mix_pages()
-    # Take pages and fill them with necessary coins
-    for size in excess_pages:
-        new_page = get_page(f"NUMIS {size}")
-        if size == "MIX":
-            while [x for x in segments.values() if len(x) > 0]:
-                new_page = get_page(f"NUMIS MIX")
-                for _ in range(4):
-                    if segments[34]:
-                        new_page.push_coin(segments[34].pop(0))
-                    else:
-                        break
-                for _ in range(12):
-                    if segments[25]:
-                        new_page.push_coin(segments[25].pop(0))
-                    else:
-                        break
-                for _ in range(16):
-                    if segments[17]:
-                        new_page.push_coin(segments[17].pop(0))
-                    else:
-                        break
-        else:
-            for c in segments[int(size)]:
-                new_page.push_coin(segments[int(size)].pop(0))
-        
-        if not new_page.is_empty():
-            book.append(new_page)
+    excess_pages = [get_page(f"NUMIS {size}") for size in plan_leftover_pages({size: len(segments[size]) for size in [34, 25, 17]})]
+    # Fill the pages from the largest coins down, so the smaller coins only 
+    # take up the larger pockets once the larger coins are all in
+    for size in [34, 25, 17]:
+        # First give each page its share of coins of its own size
+        for new_page in excess_pages:
+            if new_page.name == "NUMIS MIX":
+                quota = MIX_QUOTAS[size]
+            else:
+                quota = new_page.get_capacity() if new_page.name == f"NUMIS {size}" else 0
+            for _ in range(min(quota, len(segments[size]))):
+                new_page.push_coin(segments[size].pop(0))
+        # Then put the rest in whatever larger pockets are still free
+        for new_page in excess_pages:
+            while segments[size]:
+                try:
+                    new_page.push_coin(segments[size][0])
+                except (SlotFullException, RuntimeError):
+                    break
+                segments[size].pop(0)
+
+    book.extend(new_page for new_page in excess_pages if not new_page.is_empty())
 
     return book
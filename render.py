@@ -0,0 +1,215 @@
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from html import escape
+from math import ceil
+from typing import Dict, List, Optional, Tuple
+
+from coins import Coin
+from pages import Page, changed_pages
+
+
+# Everything is drawn in millimeters, on a page as wide as a NUMIS sheet
+PAGE_WIDTH = 220
+MARGIN = 10
+POCKET_GAP = 4
+SLOT_GAP = 8
+
+# The name of a Page and the (capacity, max_diameter) of each of its Slots
+Layout = Tuple[str, Tuple[Tuple[int, float], ...]]
+
+
+def get_layout(page: Page) -> Layout:
+    """Return the parts of a Page that decide how its template looks."""
+
+    return (page.name, tuple((slot.capacity, slot.max_diameter) for slot in page.slots))
+
+
+def _slot_grid(capacity: int, max_diameter: float) -> Tuple[int, int, float]:
+    """Return the columns, rows and spacing of the pockets in a Slot."""
+
+    pitch = max_diameter + POCKET_GAP
+    columns = max(1, min(capacity, int((PAGE_WIDTH - 2 * MARGIN) // pitch)))
+    return columns, ceil(capacity / columns), pitch
+
+
+def _pockets(layout: Layout) -> Tuple[float, List[Tuple[float, float, float]]]:
+    """Return the height of a page and the centre and diameter of each pocket."""
+
+    pockets = []
+    y = MARGIN
+    for capacity, max_diameter in layout[1]:
+        columns, rows, pitch = _slot_grid(capacity, max_diameter)
+        for i in range(capacity):
+            row, column = divmod(i, columns)
+            pockets.append((MARGIN + (column + 0.5) * pitch, y + (row + 0.5) * pitch, max_diameter))
+        y += rows * pitch + SLOT_GAP
+    return y - SLOT_GAP + MARGIN, pockets
+
+
+@lru_cache(maxsize=None)
+def get_template(layout: Layout, fmt: str) -> Tuple[str, ...]:
+    """Return the static parts of a page's drawing, split around each pocket's label.
+
+    The pieces only depend on the layout, so they are built once per kind of
+    page (in each worker) and the labels are slotted in between them.
+    """
+
+    height, pockets = _pockets(layout)
+    pieces = []
+    if fmt == "svg":
+        head = [
+            f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {PAGE_WIDTH} {height:g}" '
+            f'width="{PAGE_WIDTH}mm" height="{height:g}mm" font-family="sans-serif">',
+            f'<rect width="{PAGE_WIDTH}" height="{height:g}" fill="white" stroke="black"/>',
+            f'<text x="{MARGIN}" y="{MARGIN * 0.7:g}" font-size="4">{escape(layout[0])}</text>',
+        ]
+        pieces.append("".join(head))
+        for x, y, diameter in pockets:
+            pieces[-1] += (
+                f'<g transform="translate({x:g},{y:g})">'
+                f'<circle r="{diameter / 2:g}" fill="none" stroke="grey" stroke-dasharray="1,1"/>'
+                f'<text font-size="{diameter / 10:g}" text-anchor="middle">'
+            )
+            pieces.append("</text></g>")
+        pieces[-1] += "</svg>"
+    elif fmt == "html":
+        pieces.append(
+            f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{escape(layout[0])}</title>'
+            f'<style>.slot{{display:grid;gap:{POCKET_GAP}mm;margin-bottom:{SLOT_GAP}mm}}'
+            f'.pocket{{border:1px dashed grey;border-radius:50%;display:flex;align-items:center;'
+            f'justify-content:center;text-align:center;overflow:hidden}}</style></head>'
+            f'<body style="width:{PAGE_WIDTH}mm;padding:{MARGIN}mm;font-family:sans-serif"><h1>{escape(layout[0])}</h1>'
+        )
+        for capacity, max_diameter in layout[1]:
+            columns, _, _ = _slot_grid(capacity, max_diameter)
+            pieces[-1] += f'<div class="slot" style="grid-template-columns:repeat({columns},{max_diameter:g}mm)">'
+            for _ in range(capacity):
+                pieces[-1] += (
+                    f'<div class="pocket" style="width:{max_diameter:g}mm;height:{max_diameter:g}mm;'
+                    f'font-size:{max_diameter / 10:g}mm">'
+                )
+                pieces.append("</div>")
+            pieces[-1] += "</div>"
+        pieces[-1] += "</body></html>"
+    else:
+        raise ValueError(f"Cannot render pages as '{fmt}' (expected 'svg' or 'html').")
+    return tuple(pieces)
+
+
+# The most characters of a label that fit across a pocket (fonts scale with it)
+LABEL_LENGTH = 18
+
+
+def get_label(c: Optional[Coin], fmt: str) -> str:
+    """Return the label drawn in a pocket for a coin (or nothing if empty)."""
+
+    if c is None:
+        return ""
+    lines = [str(c.year), c.issuer, c.title]
+    lines = [escape(x if len(x) <= LABEL_LENGTH else x[:LABEL_LENGTH - 1] + "\u2026") for x in lines]
+    if fmt == "svg":
+        return "".join(
+            f'<tspan x="0" dy="{"-1.2em" if i == 0 else "1.2em"}">{line}</tspan>' 
+            for i, line in enumerate(lines)
+        ) + f"<title>{escape(c.title)}</title>"
+    return "<br>".join(lines)
+
+
+def render_page(page: Page, fmt: str="svg") -> str:
+    """Return a drawing of a Page as an svg or html document."""
+
+    pieces = get_template(get_layout(page), fmt)
+    labels = [get_label(c, fmt) for slot in page.slots for c in slot.coins]
+    return "".join(piece + label for piece, label in zip(pieces, labels + [""]))
+
+
+def _render_pages(args: Tuple[List[Page], str]) -> List[str]:
+    """Render a batch of Pages, in a worker process."""
+
+    pages, fmt = args
+    return [render_page(page, fmt) for page in pages]
+
+
+def render_pages(pages: List[Page], fmt: str="svg", workers: int=1) -> List[str]:
+    """Render many Pages at once, optionally split across worker processes.
+
+    By default everything is done in this process. Drawing a Page takes about
+    0.2ms, but sending it to a worker and the drawing back takes about 0.4ms,
+    so a pool was slower at every number of Pages tried (up to 15,000). With
+    `workers` above 1, Pages are sent to that many workers in batches so each
+    one only builds the templates it needs once.
+    """
+
+    if workers <= 1 or len(pages) < 2:
+        return [render_page(page, fmt) for page in pages]
+
+    batch_size = ceil(len(pages) / workers)
+    batches = [(pages[i:i + batch_size], fmt) for i in range(0, len(pages), batch_size)]
+    drawings = []
+    with ProcessPoolExecutor(max_workers=min(workers, len(batches))) as executor:
+        for batch in executor.map(_render_pages, batches):
+            drawings.extend(batch)
+    return drawings
+
+
+def render_book(book: List[Page], directory: str, fmt: str="svg", workers: int=1) -> List[int]:
+    """Write a drawing of every Page of a book that changed since the last run.
+
+    The fingerprint of each Page is saved in the directory, so Pages that
+    look the same as the last time they were drawn are skipped. Returns the
+    indices of the Pages that were drawn.
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    fingerprints_file = os.path.join(directory, "fingerprints.json")
+    try:
+        with open(fingerprints_file, "r") as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        saved = {}
+    if not isinstance(saved, dict):
+        saved = {}
+    fingerprints = saved.get(fmt, [])
+    paths = [os.path.join(directory, f"page_{i + 1:03}.{fmt}") for i in range(max(len(book), len(fingerprints)))]
+
+    # Drawings deleted by hand are made again even if the Page did not change
+    changed = sorted(set(changed_pages(book, fingerprints)) | {i for i in range(len(book)) if not os.path.exists(paths[i])})
+    drawings = render_pages([book[i] for i in changed], fmt, workers)
+    for i, drawing in zip(changed, drawings):
+        with open(paths[i], "w", encoding="utf-8") as f:
+            f.write(drawing)
+    # Remove the drawings of pages the book no longer has
+    for path in paths[len(book):]:
+        if os.path.exists(path):
+            os.remove(path)
+
+    saved[fmt] = [page.fingerprint() for page in book]
+    with open(fingerprints_file, "w") as f:
+        json.dump(saved, f)
+    return changed
+
+
+def book_directory(name: str) -> str:
+    """Return a name for a book that is safe to use as a directory."""
+
+    return re.sub(r"[^\w]+", "_", name).strip("_").lower()
+
+
+def render_books(books: Dict[str, List[Page]], directory: str="Layouts", fmt: str="svg", workers: int=1) -> Dict[str, List[int]]:
+    """Write the drawings of every book, each in its own directory."""
+
+    return {
+        name: render_book(book, os.path.join(directory, book_directory(name)), fmt, workers)
+        for name, book in books.items()
+    }
+
+
+if __name__ == "__main__":
+    from main import build_books
+
+    books = build_books("Collections/YaBoiLennyG_coins.csv")
+    for name, changed in render_books(books).items():
+        print(f"{name}: {len(changed)} pages drawn")
@@ -0,0 +1,213 @@
+import sqlite3
+from collections import defaultdict
+from csv import DictReader
+from typing import Dict, List, Optional
+
+from coins import Coin, CoinType, Grade
+from countries import map_to_region_name
+from duplicates import DuplicateIndex
+from main import has_needed_fields, row_to_coin
+from pages import DIAMETER_CLASSES, diameter_class
+
+
+# The csv fields a Coin does not keep as text, and the column of the store
+# keeping their original text for exclusions
+RAW_COLUMNS: Dict[str, str] = {
+    "Face value": "face_value_text",
+    "N# number (with link)": "numista_text",
+    "Weight": "weight_text",
+    "Diameter": "diameter_text",
+    "Thickness": "thickness_text",
+    "Year": "year_text",
+    "Gregorian year": "gregorian_year_text",
+    # Not part of a Coin, but in every Numista export
+    "Currency": "currency",
+    "Year range": "year_range",
+    "Shape": "shape",
+    "Quantity": "quantity",
+}
+
+# The columns of the store that each csv field can be excluded on, compared
+# against the same text `parser()` compares against
+EXCLUSION_COLUMNS: Dict[str, str] = {
+    "Country": "country",
+    "Issuer": "issuer",
+    "Title": "title",
+    "Composition": "composition",
+    "Reference": "reference",
+    "Type": "type",
+    "Mintmark": "mintmark",
+    "Grade": "grade",
+    "Collection": "collection",
+    "Public comment": "comment",
+    **RAW_COLUMNS,
+}
+
+# Bumped whenever the table changes, so older stores are rebuilt
+SCHEMA_VERSION = 2
+
+COIN_COLUMNS = "country, issuer, face_value, numista_id, title, composition, weight, diameter, thickness, year, gregorian_year, reference, type, mintmark, grade, comment"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS coins (
+    country TEXT NOT NULL,
+    issuer TEXT NOT NULL,
+    face_value REAL NOT NULL,
+    numista_id INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    composition TEXT NOT NULL,
+    weight REAL NOT NULL,
+    diameter REAL NOT NULL,
+    thickness REAL,
+    year INTEGER NOT NULL,
+    gregorian_year INTEGER NOT NULL,
+    reference TEXT NOT NULL,
+    type TEXT NOT NULL,
+    mintmark TEXT NOT NULL,
+    grade TEXT NOT NULL,
+    comment TEXT NOT NULL,
+    collection TEXT NOT NULL,
+    region TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    face_value_text TEXT NOT NULL,
+    numista_text TEXT NOT NULL,
+    weight_text TEXT NOT NULL,
+    diameter_text TEXT NOT NULL,
+    thickness_text TEXT NOT NULL,
+    year_text TEXT NOT NULL,
+    gregorian_year_text TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    year_range TEXT NOT NULL,
+    shape TEXT NOT NULL,
+    quantity TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS coins_by_region ON coins (region);
+CREATE INDEX IF NOT EXISTS coins_by_size ON coins (size, issuer, gregorian_year, title, diameter);
+CREATE INDEX IF NOT EXISTS coins_by_numista_id ON coins (numista_id);
+CREATE INDEX IF NOT EXISTS coins_by_year ON coins (year);
+"""
+
+
+def open_store(db_file: str) -> sqlite3.Connection:
+    """Open (or create) a store of coins in a SQLite database.
+
+    A store made by an older version is emptied and needs `load_csv()` again.
+    """
+
+    conn = sqlite3.connect(db_file)
+    (version,) = conn.execute("PRAGMA user_version").fetchone()
+    if version != SCHEMA_VERSION:
+        conn.execute("DROP TABLE IF EXISTS coins")
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def load_csv(conn: sqlite3.Connection, filename: str) -> Optional[int]:
+    """Replace the coins in the store with those of a csv.
+
+    Every row is loaded, as exclusions are applied when querying. Returns
+    the number of coins loaded, or `None` if the csv is not formatted right.
+    """
+
+    with open(filename, "r") as f:
+        reader = DictReader(f)
+        if not has_needed_fields(reader.fieldnames):
+            return None
+        rows = []
+        for row in reader:
+            c = row_to_coin(row)
+            rows.append((
+                c.country, c.issuer, c.face_value, c.numista_id, c.title,
+                c.composition, c.weight, c.diameter, c.thickness, c.year,
+                c.gregorian_year, c.reference, c.type.value, c.mintmark,
+                c.grade.value, c.comment, row['Collection'],
+                map_to_region_name(c.country), diameter_class(c.diameter),
+                *[row.get(ex_field) or "" for ex_field in RAW_COLUMNS]
+            ))
+    with conn:
+        conn.execute("DELETE FROM coins")
+        conn.executemany(f"INSERT INTO coins VALUES ({', '.join('?' * (19 + len(RAW_COLUMNS)))})", rows)
+    return len(rows)
+
+
+def _to_coin(row: tuple) -> Coin:
+    """Create a Coin from a row selected with COIN_COLUMNS."""
+
+    return Coin(*row[:12], type=CoinType(row[12]), mintmark=row[13], grade=Grade(row[14]), comment=row[15])
+
+
+def _exclusion_clause(exclusions: Dict[str, list]) -> tuple:
+    """Return the SQL condition (and its parameters) that keeps coins not excluded."""
+
+    clauses, params = [], []
+    for ex_field, ex_values in (exclusions or {}).items():
+        if ex_field not in EXCLUSION_COLUMNS:
+            raise ValueError(f"Cannot exclude on field '{ex_field}' in the store.")
+        if ex_values:
+            clauses.append(f"{EXCLUSION_COLUMNS[ex_field]} NOT IN ({', '.join('?' * len(ex_values))})")
+            params.extend(ex_values)
+    return " AND ".join(clauses) or "1", params
+
+
+def store_parser(conn: sqlite3.Connection, exclusions: Dict[str, list]=None, duplicates: DuplicateIndex=None) -> Dict[str, List[Coin]]:
+    """Return a dictionary of all current collections, like `parser()`.
+    
+    `duplicates` works the same as in `parser()`.
+    """
+
+    where, params = _exclusion_clause(exclusions)
+    my_coins = defaultdict(list)
+    for row in conn.execute(f"SELECT region, {COIN_COLUMNS} FROM coins WHERE {where} ORDER BY rowid", params):
+        if duplicates is None:
+            my_coins[row[0]].append(_to_coin(row[1:]))
+        else:
+            duplicates.add(_to_coin(row[1:]), my_coins[row[0]])
+    return my_coins
+
+
+def store_segments(conn: sqlite3.Connection, regions: List[str], exclusions: Dict[str, list]=None, duplicates: DuplicateIndex=None) -> Dict[int, List[Coin]]:
+    """Return the coins of some regions, ready for `create_book_from_segments()`.
+
+    Each `diameter_class()` is read with a range scan over the size index,
+    so the coins already come out in the order the book is filled in. 
+    
+    If `duplicates` is given, the copies have to be compared in the order 
+    they were loaded, so the coins are read in that order and sorted after.
+    """
+
+    where, params = _exclusion_clause(exclusions)
+    if duplicates is not None:
+        query = (
+            f"SELECT size, {COIN_COLUMNS} FROM coins "
+            f"WHERE region IN ({', '.join('?' * len(regions))}) AND {where} ORDER BY rowid"
+        )
+        segments = defaultdict(list)
+        for row in conn.execute(query, [*regions, *params]):
+            duplicates.add(_to_coin(row[1:]), segments[row[0]])
+        [ls.sort(key=lambda c : (c.issuer, c.gregorian_year, c.title, c.diameter)) for ls in segments.values()]
+        return {size: segments[size] for size in [0] + DIAMETER_CLASSES if segments[size]}
+
+    query = (
+        f"SELECT {COIN_COLUMNS} FROM coins INDEXED BY coins_by_size "
+        f"WHERE size = ? AND region IN ({', '.join('?' * len(regions))}) AND {where} "
+        f"ORDER BY issuer, gregorian_year, title, diameter, rowid"
+    )
+    segments = {}
+    for size in [0] + DIAMETER_CLASSES:
+        coins = [_to_coin(row) for row in conn.execute(query, [size, *regions, *params])]
+        if coins:
+            segments[size] = coins
+    return segments
+
+
+def find_coins(conn: sqlite3.Connection, numista_id: int=None, year: int=None, region: str=None) -> List[Coin]:
+    """Return the coins matching all of the given lookups, using the indexes."""
+
+    clauses, params = [], []
+    for column, value in [("numista_id", numista_id), ("year", year), ("region", region)]:
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    where = " AND ".join(clauses) or "1"
+    return [_to_coin(row) for row in conn.execute(f"SELECT {COIN_COLUMNS} FROM coins WHERE {where} ORDER BY rowid", params)]
@@ -0,0 +1,81 @@
+import hashlib
+
+from checkpoint import checkpointed_parser, load_checkpoint
+from duplicates import DuplicateIndex
+from main import EXCLUSIONS, parser
+
+
+COLLECTION = "Collections/YaBoiLennyG_coins.csv"
+
+
+def read_lines() -> list:
+    with open(COLLECTION, "rb") as f:
+        return f.read().splitlines(keepends=True)
+
+
+def assert_matches_parser(filename: str) -> None:
+    """Check checkpointed_parser() against parser(), and that the checkpoint is up to date."""
+
+    checkpoint_duplicates, csv_duplicates = DuplicateIndex(), DuplicateIndex()
+    assert dict(checkpointed_parser(filename, EXCLUSIONS)) == dict(parser(filename, EXCLUSIONS))
+    assert dict(checkpointed_parser(filename, EXCLUSIONS, f"{filename}.dup", checkpoint_duplicates)) == dict(parser(filename, EXCLUSIONS, csv_duplicates))
+    assert checkpoint_duplicates.get_trades() == csv_duplicates.get_trades()
+
+    with open(filename, "rb") as f:
+        data = f.read()
+    for checkpoint_file in [f"{filename}.checkpoint", f"{filename}.dup"]:
+        checkpoint = load_checkpoint(checkpoint_file)
+        assert checkpoint.prefix_hash == hashlib.sha256(data[:checkpoint.offset]).hexdigest()
+
+
+def test_appended_rows(tmp_path):
+    lines = read_lines()
+    filename = str(tmp_path / "coins.csv")
+    with open(filename, "wb") as f:
+        f.writelines(lines[:300])
+    assert_matches_parser(filename)
+
+    # Including rows duplicating earlier ones, and a last row still being written
+    with open(filename, "ab") as f:
+        f.writelines(lines[300:] + lines[1:20])
+        f.write(lines[20].rstrip())
+    assert_matches_parser(filename)
+    assert load_checkpoint(f"{filename}.checkpoint").offset == sum(map(len, lines)) + sum(map(len, lines[1:20]))
+
+
+def test_rewritten_at_same_length(tmp_path):
+    lines = read_lines()
+    filename = str(tmp_path / "coins.csv")
+    with open(filename, "wb") as f:
+        f.writelines(lines)
+    assert_matches_parser(filename)
+
+    row = next(i for i, line in enumerate(lines) if b'"VF"' in line)
+    lines[row] = lines[row].replace(b'"VF"', b'"XF"')
+    with open(filename, "wb") as f:
+        f.writelines(lines)
+    assert_matches_parser(filename)
+
+
+def test_truncated(tmp_path):
+    lines = read_lines()
+    filename = str(tmp_path / "coins.csv")
+    with open(filename, "wb") as f:
+        f.writelines(lines)
+    assert_matches_parser(filename)
+
+    with open(filename, "wb") as f:
+        f.writelines(lines[:200])
+    assert_matches_parser(filename)
+
+
+def test_unreadable_checkpoint_is_parsed_again(tmp_path):
+    filename = str(tmp_path / "coins.csv")
+    with open(filename, "wb") as f:
+        f.writelines(read_lines())
+    # Such as one pickled by an older version
+    with open(f"{filename}.checkpoint", "wb") as f:
+        f.write(b"\x80\x04\x95not json")
+
+    assert load_checkpoint(f"{filename}.checkpoint") is None
+    assert_matches_parser(filename)
@@ -0,0 +1,59 @@
+import random
+from collections import Counter
+from itertools import combinations_with_replacement
+
+from coins import Coin
+from pages import count_pages, create_book, get_page, plan_leftover_pages
+
+
+# A diameter that falls in each diameter class
+DIAMETERS = {17: 15.0, 25: 22.0, 34: 30.0, 44: 40.0}
+
+
+def make_coin(diameter: float, numista_id: int) -> Coin:
+    return Coin("Canada", "Canada", 1, numista_id, "1 Cent", "Copper", 2.5, diameter, 1.5, 2000, 2000)
+
+
+def test_count_pages_matches_create_book():
+    rng = random.Random(29)
+    for _ in range(2000):
+        counts = {size: rng.randint(0, rng.choice([5, 30, 80, 200])) for size in DIAMETERS}
+        coins = [make_coin(DIAMETERS[size], i) for size, n in counts.items() for i in range(n)]
+        book = create_book(coins)
+
+        assert dict(Counter(page.name for page in book)) == count_pages(counts), counts
+        assert sum(len(page) for page in book) == len(coins), counts
+
+
+def fewest_leftover_pages(counts: dict) -> int:
+    """Return the fewest pages holding the coins, trying every set of pages."""
+
+    for num_pages in range(4):
+        for names in combinations_with_replacement(["NUMIS 34", "NUMIS 25", "NUMIS 17", "NUMIS MIX"], num_pages):
+            slots = [slot for name in names for slot in get_page(name).slots]
+            # Each size of coin can use any pocket left over by the larger ones
+            if all(
+                sum(counts[s] for s in counts if s >= size) <= sum(slot.capacity for slot in slots if slot.max_diameter >= size)
+                for size in counts
+            ):
+                return num_pages
+
+
+def test_plan_leftover_pages_matches_brute_force():
+    rng = random.Random(32)
+    cases = [{34: 0, 25: 29, 17: 1}, {34: 15, 25: 0, 17: 5}]
+    cases += [{34: rng.randrange(20), 25: rng.randrange(30), 17: rng.randrange(48)} for _ in range(500)]
+    for counts in cases:
+        coins = [make_coin(DIAMETERS[size], i) for size, n in counts.items() for i in range(n)]
+        book = create_book(coins)
+
+        assert len(plan_leftover_pages(counts)) == fewest_leftover_pages(counts), counts
+        assert len(book) == fewest_leftover_pages(counts), counts
+        assert sum(len(page) for page in book) == len(coins), counts
+
+
+def test_create_book_leaves_out_oversized_coins():
+    coins = [make_coin(50.0, 1), make_coin(22.0, 2)]
+    book = create_book(coins)
+
+    assert [c.numista_id for page in book for c in page.get_coins()] == [2]
@@ -0,0 +1,32 @@
+import pytest
+
+from duplicates import DuplicateIndex
+from main import parser
+from store import load_csv, open_store, store_parser
+
+
+COLLECTION = "Collections/YaBoiLennyG_coins.csv"
+
+
+@pytest.mark.parametrize("exclusions", [
+    {"Grade": ["UNC"], "Collection": ["Euro Booklet"]},
+    {"Year": ["2000", "1990"]},
+    {"Diameter": ["24.25"], "Weight": ["5.5"]},
+    {"N# number (with link)": ["N# 2876"]},
+    {"Thickness": [""], "Face value": ["20"]},
+    {"Shape": ["Round"]},
+])
+def test_store_parser_matches_parser(tmp_path, exclusions):
+    conn = open_store(str(tmp_path / "coins.db"))
+    load_csv(conn, COLLECTION)
+
+    assert dict(store_parser(conn, exclusions)) == dict(parser(COLLECTION, exclusions))
+
+
+def test_store_parser_leaves_out_duplicates_like_parser(tmp_path):
+    conn = open_store(str(tmp_path / "coins.db"))
+    load_csv(conn, COLLECTION)
+    store_duplicates, csv_duplicates = DuplicateIndex(), DuplicateIndex()
+
+    assert dict(store_parser(conn, {}, store_duplicates)) == dict(parser(COLLECTION, {}, csv_duplicates))
+    assert store_duplicates.get_trades() == csv_duplicates.get_trades()
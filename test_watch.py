@@ -0,0 +1,41 @@
+import os
+import shutil
+
+from watch import CollectionWatcher
+
+
+COLLECTION = "Collections/YaBoiLennyG_coins.csv"
+
+
+def watch_copy(tmp_path, errors: list) -> CollectionWatcher:
+    shutil.copy(COLLECTION, tmp_path / "a.csv")
+    watcher = CollectionWatcher(str(tmp_path), on_error=lambda path, e : errors.append(e))
+    watcher.refresh(0)
+    watcher.refresh(10)
+    return watcher
+
+
+def test_deleted_export_is_taken_out_of_the_books(tmp_path):
+    watcher = watch_copy(tmp_path, [])
+    assert all(watcher.books.values())
+
+    os.remove(tmp_path / "a.csv")
+    watcher.refresh(20)
+    updated = watcher.refresh(30)
+
+    assert set(updated) == set(watcher.groups)
+    assert not any(watcher.books.values())
+
+
+def test_malformed_row_keeps_the_previous_books(tmp_path):
+    errors = []
+    watcher = watch_copy(tmp_path, errors)
+    books = dict(watcher.books)
+
+    with open(tmp_path / "a.csv", "a") as f:
+        f.write('"Canada","Canada",1\n')
+    watcher.refresh(20)
+
+    assert watcher.refresh(30) == {}
+    assert watcher.books == books
+    assert len(errors) == 1
@@ -0,0 +1,184 @@
+import csv
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from checkpoint import checkpointed_parser
+from coins import Coin
+from duplicates import DuplicateIndex
+from pages import Page, book_fingerprint, create_book
+from main import BOOK_GROUPS, EXCLUSIONS, print_book
+
+
+# The (modification time, size) of a file, used to tell when it has changed
+Signature = Tuple[int, int]
+
+
+def scan(directory: str) -> Dict[str, Signature]:
+    """Return the signature of every csv file in a directory."""
+
+    signatures = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.lower().endswith(".csv"):
+                stat = entry.stat()
+                signatures[entry.path] = (stat.st_mtime_ns, stat.st_size)
+    return signatures
+
+
+def print_error(path: str, error: Exception) -> None:
+    """Print why a file could not be parsed."""
+
+    print(f"Could not parse '{path}', keeping its previous coins: {error!r}")
+
+
+@dataclass
+class CollectionWatcher:
+    """A class to keep the books up to date with the exports in a directory.
+
+    The directory is polled rather than relying on filesystem events, so it
+    works the same on every platform. Only the files that changed since the
+    last poll are parsed again (reading only appended rows where possible), and
+    only the books holding coins from those files are paginated again.
+
+    Attributes
+    ----------
+    directory : str
+        The directory containing the Numista csv exports.
+    exclusions : Dict[str, list] = EXCLUSIONS
+        The filter passed to `checkpointed_parser()` for every file.
+    groups : Dict[str, List[str]] = BOOK_GROUPS
+        The name of each book, mapped to the regions it holds.
+    debounce : float = 2.0
+        The number of seconds a file must stay unchanged before it is parsed,
+        so that exports still being written are not read halfway through.
+    duplicates : bool = True
+        Whether to keep only the best graded copy of each coin, like `main()`.
+        Copies are compared across every file, not just within each one.
+    signatures : Dict[str, Signature] = field(default_factory=dict)
+        The signature of each file at the time it was last parsed.
+    file_coins : Dict[str, Dict[str, List[Coin]]] = field(default_factory=dict)
+        The coins parsed from each file, keyed by region.
+    books : Dict[str, List[Page]] = field(default_factory=dict)
+        The current pages of each book.
+    fingerprints : Dict[str, str] = field(default_factory=dict)
+        The `book_fingerprint()` of each book, so books that come out the 
+        same after a change are not published again.
+    trades : Dict[str, List[Coin]] = field(default_factory=dict)
+        The copies left out of each book, if `duplicates` is set.
+    on_error : Callable[[str, Exception], None] = print_error
+        Called with the file and the error when a file cannot be parsed. The
+        file keeps its previous coins and is not parsed again until it changes.
+    """
+
+    directory: str
+    exclusions: Dict[str, list] = field(default_factory=lambda: EXCLUSIONS)
+    groups: Dict[str, List[str]] = field(default_factory=lambda: BOOK_GROUPS)
+    debounce: float = 2.0
+    duplicates: bool = True
+    signatures: Dict[str, Signature] = field(default_factory=dict)
+    file_coins: Dict[str, Dict[str, List[Coin]]] = field(default_factory=dict)
+    books: Dict[str, List[Page]] = field(default_factory=dict)
+    fingerprints: Dict[str, str] = field(default_factory=dict)
+    trades: Dict[str, List[Coin]] = field(default_factory=dict)
+    on_error: Callable[[str, Exception], None] = field(default=print_error, repr=False)
+    _failed: Dict[str, Signature] = field(default_factory=dict, repr=False)
+    _pending: Dict[str, Tuple[Optional[Signature], float]] = field(default_factory=dict, repr=False)
+
+
+    def poll(self, now: Optional[float] = None) -> Dict[str, Optional[Signature]]:
+        """Check the directory once and return the files ready to be parsed.
+
+        A file is ready once its signature has not moved for `debounce`
+        seconds. Deleted files are reported with a signature of `None`.
+        """
+
+        now = time.monotonic() if now is None else now
+        current = scan(self.directory)
+        for path in set(current) | set(self.signatures) | set(self._pending) | set(self._failed):
+            signature = current.get(path)
+            if signature == self.signatures.get(path) or (path in self._failed and signature == self._failed[path]):
+                self._pending.pop(path, None)
+            elif path not in self._pending or self._pending[path][0] != signature:
+                self._pending[path] = (signature, now)
+
+        ready = [path for path, (_, seen) in self._pending.items() if now - seen >= self.debounce]
+        return {path: self._pending.pop(path)[0] for path in ready}
+
+
+    def ingest(self, changes: Dict[str, Optional[Signature]]) -> Set[str]:
+        """Parse the changed files again and return the books they affect.
+
+        `changes` maps each file to its new signature, or `None` if the file
+        was deleted.
+        """
+
+        affected_regions = set()
+        for path, signature in changes.items():
+            self._failed.pop(path, None)
+            if signature is None:
+                old_coins = self.file_coins.pop(path, {})
+                affected_regions.update(region for region, coins in old_coins.items() if coins)
+                self.signatures.pop(path, None)
+                continue
+            try:
+                new_coins = checkpointed_parser(path, self.exclusions) or {}
+            except (OSError, ValueError, KeyError, IndexError, TypeError, csv.Error) as e:
+                # A bad row should not stop the watcher; wait for the file to change again
+                self._failed[path] = signature
+                self.on_error(path, e)
+                continue
+            old_coins = self.file_coins.pop(path, {})
+            affected_regions.update(region for region, coins in old_coins.items() if coins)
+            affected_regions.update(region for region, coins in new_coins.items() if coins)
+            self.file_coins[path] = new_coins
+            self.signatures[path] = signature
+
+        return {book for book, group in self.groups.items() if affected_regions.intersection(group)}
+
+
+    def paginate(self, book_names: Set[str]) -> Dict[str, List[Page]]:
+        """Create the given books again and return those whose pages changed."""
+
+        updated = {}
+        for book in book_names:
+            coins = []
+            for path in sorted(self.file_coins):
+                [coins.extend(self.file_coins[path].get(g, [])) for g in self.groups[book]]
+            duplicates = DuplicateIndex() if self.duplicates else None
+            pages = create_book(coins, duplicates)
+            if duplicates is not None:
+                self.trades[book] = duplicates.get_trades()
+            fingerprint = book_fingerprint(pages)
+            if self.fingerprints.get(book) != fingerprint:
+                self.fingerprints[book] = fingerprint
+                updated[book] = pages
+        self.books.update(updated)
+        return updated
+
+
+    def refresh(self, now: Optional[float] = None) -> Dict[str, List[Page]]:
+        """Poll the directory and return the books that had to be updated."""
+
+        ready = self.poll(now)
+        if not ready:
+            return {}
+        return self.paginate(self.ingest(ready))
+
+
+    def run(self, interval: float = 1.0, publish: Callable[[str, List[Page]], None] = print_book) -> None:
+        """Watch the directory forever, publishing each book once it changes.
+
+        Every file already in the directory is parsed on the first poll.
+        """
+
+        self.paginate(self.ingest(scan(self.directory)))
+        [publish(book, pages) for book, pages in self.books.items()]
+        while True:
+            time.sleep(interval)
+            [publish(book, pages) for book, pages in self.refresh().items()]
+
+
+if __name__ == "__main__":
+    CollectionWatcher("Collections").run()
@@ -0,0 +1,131 @@
+from collections import defaultdict
+from csv import DictReader
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from coins import Grade
+from pages import count_pages, diameter_class
+from countries import build_routes
+from duplicates import GRADE_RANK, duplicate_key
+from main import BOOK_GROUPS, has_needed_fields, row_to_coin
+
+
+def _to_mask(bits: bytearray) -> int:
+    """Return a bytearray of 0s and 1s (one per row) packed into an int."""
+
+    # Row 0 is the lowest bit, so the bytes are read backwards as a binary number
+    return int(bits[::-1].translate(bytes.maketrans(b"\x00\x01", b"01")) or b"0", 2)
+
+
+@dataclass
+class WhatIfIndex:
+    """A class to answer how many pages each book needs under many exclusions.
+
+    Every row of the csv is given a bit, so the rows matching an exclusion
+    and the rows in each book can be kept as masks (ints). The coins left in
+    a book under some exclusions are then found with a few bitwise
+    operations, without parsing the csv again or creating any Pages.
+
+    Attributes
+    ----------
+    columns : Dict[str, List[str]]
+        The value of every field for each row that is in a book.
+    book_masks : Dict[str, Dict[int, int]]
+        The rows in each book, split up by `diameter_class()`.
+    duplicate_groups : List[Tuple[str, List[int]]] = field(default_factory=list)
+        The book and rows of each coin with more than one copy, if duplicates
+        are being left out. Only the best graded copy left after the 
+        exclusions is counted, as `parser()` would keep.
+    field_masks : Dict[Tuple[str, str], int] = field(default_factory=dict)
+        The rows where a field (first) is a given value (second), built the
+        first time that exclusion is asked for.
+    """
+
+    columns: Dict[str, List[str]]
+    book_masks: Dict[str, Dict[int, int]]
+    duplicate_groups: List[Tuple[str, List[int]]] = field(default_factory=list)
+    field_masks: Dict[Tuple[str, str], int] = field(default_factory=dict)
+
+
+    def mask(self, ex_field: str, ex_value: str) -> int:
+        """Return the rows where a field is a given value."""
+
+        key = (ex_field, ex_value)
+        if key not in self.field_masks:
+            self.field_masks[key] = _to_mask(bytearray(x == ex_value for x in self.columns[ex_field]))
+        return self.field_masks[key]
+
+
+    def excluded(self, exclusions: Dict[str, list]) -> int:
+        """Return the rows filtered out by exclusions, as `parser()` would."""
+
+        rows = 0
+        for ex_field, ex_values in exclusions.items():
+            for ex_value in ex_values:
+                rows |= self.mask(ex_field, ex_value)
+        return rows
+
+
+    def page_counts(self, exclusions: Dict[str, list]=None) -> Dict[str, Dict[str, int]]:
+        """Return how many of each page every book needs under exclusions."""
+
+        excluded = self.excluded(exclusions or {})
+        counts = {
+            book: {size: bin(rows & ~excluded).count("1") for size, rows in segments.items()}
+            for book, segments in self.book_masks.items()
+        }
+        for book, rows in self.duplicate_groups:
+            left = [i for i in rows if not excluded >> i & 1]
+            if len(left) < 2:
+                continue
+            # The first of the best graded copies is the one kept
+            kept = max(left, key=lambda i : (GRADE_RANK[Grade(self.columns['Grade'][i])], -i))
+            for i in left:
+                if i != kept:
+                    counts[book][diameter_class(float(self.columns['Diameter'][i]))] -= 1
+        return {book: count_pages(sizes) for book, sizes in counts.items()}
+
+
+    def evaluate(self, scenarios: List[Dict[str, list]]) -> List[Dict[str, Dict[str, int]]]:
+        """Return the `page_counts()` of each scenario of exclusions."""
+
+        return [self.page_counts(exclusions) for exclusions in scenarios]
+
+
+def build_what_if(filename: str, routes: Dict[str, str]=None, duplicates: bool=False) -> Optional[WhatIfIndex]:
+    """Parse a csv once into a WhatIfIndex.
+
+    `routes` is a table from `build_routes()`, and defaults to the books in
+    `BOOK_GROUPS`. Coins from countries not in `routes` are left out. If 
+    `duplicates` is set, only the best graded copy of each coin is counted.
+    """
+
+    routes = routes or build_routes(BOOK_GROUPS)
+    with open(filename, "r") as f:
+        reader = DictReader(f)
+        # csv is not formatted right
+        if not has_needed_fields(reader.fieldnames):
+            return None
+        columns = {name: [] for name in reader.fieldnames}
+        segments: Dict[str, Dict[int, List[int]]] = defaultdict(lambda: defaultdict(list))
+        copies: Dict[tuple, List[int]] = defaultdict(list)
+        for row in reader:
+            book = routes.get(row['Country'])
+            if book is None:
+                continue
+            segments[book][diameter_class(float(row['Diameter']))].append(len(columns['Country']))
+            if duplicates:
+                copies[book, duplicate_key(row_to_coin(row))].append(len(columns['Country']))
+            for name, values in columns.items():
+                values.append(row[name])
+
+    num_rows = len(columns['Country'])
+    book_masks = {book: {} for book in dict.fromkeys(routes.values())}
+    for book, sizes in segments.items():
+        for size, rows in sizes.items():
+            bits = bytearray(num_rows)
+            for i in rows:
+                bits[i] = 1
+            book_masks[book][size] = _to_mask(bits)
+    duplicate_groups = [(book, rows) for (book, _), rows in copies.items() if len(rows) > 1]
+    return WhatIfIndex(columns, book_masks, duplicate_groups)